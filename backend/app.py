@@ -1,16 +1,24 @@
-from flask import Flask, render_template
+from flask import Flask, Response, render_template, request, jsonify
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
 import base64
+import hmac
 import io
 import json
 import tempfile
 import os
 import subprocess
-from src.recognition import recognize_sound, infer_sound_direction, calculate_motor_powers
+from src.recognition import recognize_sound, infer_sound_direction, calculate_motor_powers, decode_image
+from src.annotate import annotate_frame
+from src.preview import PreviewStream, BOUNDARY
+from src.profiling import RequestProfiler
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'yummy'
+app.config['PREVIEW_FPS'] = float(os.environ.get('PREVIEW_FPS', 5))
+app.config['PREVIEW_TOKEN'] = os.environ.get('PREVIEW_TOKEN')
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', 'profiles')
+app.config['PROFILING_TOKEN'] = os.environ.get('PROFILING_TOKEN')
 CORS(app)
 socketio = SocketIO(app, cors_allowed_origins="*", max_http_buffer_size=10000000)
 
@@ -23,6 +31,51 @@ latest_images = {
 audio_buffers = {}
 streaming_active = {}
 
+preview = PreviewStream(fps=app.config['PREVIEW_FPS'])
+profiler = RequestProfiler(output_dir=app.config['PROFILE_DIR'])
+
+def current_device():
+    return request.sid
+
+def token_matches(token, expected):
+    """Locked unless a token is configured and the given one matches"""
+    if not expected or not isinstance(token, str):
+        return False
+    return hmac.compare_digest(token.encode(), expected.encode())
+
+def profiling_allowed(token):
+    return token_matches(token, app.config['PROFILING_TOKEN'])
+
+def configure_profiling(options):
+    """requests defaults to 1 in fixed-count mode and to 0 (up to MAX_DUMPS) with slow_ms"""
+    if not options.get('enabled', True):
+        return profiler.disable()
+    slow_ms = options.get('slow_ms')
+    return profiler.configure(
+        requests=options.get('requests', 1 if slow_ms is None else 0),
+        slow_ms=slow_ms,
+        memory=options.get('memory', False),
+        interval=options.get('interval')
+    )
+
+def publish_preview(frames, angle, sound, detection_info):
+    """Annotate the chosen camera frame for /preview viewers, skipped when nobody is watching"""
+    if not preview.wants_frame():
+        return
+    
+    # The result has already been emitted, so a preview failure is only logged
+    try:
+        camera = detection_info.get('camera')
+        if camera not in frames:
+            preview.publish(frames['front'])
+            return
+        
+        frame = frames[camera]
+        annotated = annotate_frame(frame, detection_info['bbox'], angle, sound, detection_info)
+        preview.publish(annotated if annotated is not None else frame)
+    except Exception as e:
+        print(f"Error publishing preview: {str(e)}")
+
 @app.route('/')
 def index():
     return {'status': 'WebSocket server running', 'endpoint': '/socket.io'}
@@ -69,6 +122,7 @@ def handle_audio_chunk(data):
         emit('error', {'message': str(e)})
 
 @socketio.on('process_audio_buffer')
+@profiler.profiled('process_audio_buffer', device=current_device)
 def handle_process_audio_buffer():
     """Process accumulated audio buffer"""
     from flask import request
@@ -128,36 +182,29 @@ def handle_process_audio_buffer():
                     })
                     return
                 
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_front:
-                    temp_front.write(latest_images['front'])
-                    temp_front_path = temp_front.name
+                frames = {
+                    'front': decode_image(latest_images['front']),
+                    'back': decode_image(latest_images['back'])
+                }
                 
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_back:
-                    temp_back.write(latest_images['back'])
-                    temp_back_path = temp_back.name
+                angle, detection_info = infer_sound_direction(
+                    frames['front'],
+                    frames['back'],
+                    sound_description
+                )
                 
-                try:
-                    angle, detection_info = infer_sound_direction(
-                        temp_front_path,
-                        temp_back_path,
-                        sound_description
-                    )
-                    
-                    motor_powers = calculate_motor_powers(angle)
-                    
-                    result = {
-                        'sound': sound_description,
-                        'angle': round(angle, 2),
-                        'motor_powers': motor_powers,
-                        'detection_info': detection_info
-                    }
-                    
-                    print(f"Result: {json.dumps(result, indent=2)}")
-                    emit('result', result)
-                    
-                finally:
-                    os.unlink(temp_front_path)
-                    os.unlink(temp_back_path)
+                motor_powers = calculate_motor_powers(angle)
+                
+                result = {
+                    'sound': sound_description,
+                    'angle': round(angle, 2),
+                    'motor_powers': motor_powers,
+                    'detection_info': detection_info
+                }
+                
+                print(f"Result: {json.dumps(result, indent=2)}")
+                emit('result', result)
+                publish_preview(frames, angle, sound_description, detection_info)
                     
             finally:
                 if temp_wav_path and os.path.exists(temp_wav_path):
@@ -216,6 +263,7 @@ def handle_image_stream(data):
         emit('error', {'message': str(e)})
 
 @socketio.on('process_all')
+@profiler.profiled('process_all', device=current_device)
 def handle_process_all(data):
     """Process audio with images in a single request"""
     try:
@@ -260,20 +308,16 @@ def handle_process_all(data):
                 temp_audio.write(audio_bytes)
                 temp_audio_path = temp_audio.name
         
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_front, \
-             tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_back:
-            
-            temp_front.write(front_bytes)
-            temp_back.write(back_bytes)
-            
-            temp_front_path = temp_front.name
-            temp_back_path = temp_back.name
+        frames = {
+            'front': decode_image(front_bytes),
+            'back': decode_image(back_bytes)
+        }
         
         try:
             sound_description = recognize_sound(temp_audio_path)
             angle, detection_info = infer_sound_direction(
-                temp_front_path,
-                temp_back_path,
+                frames['front'],
+                frames['back'],
                 sound_description
             )
             motor_powers = calculate_motor_powers(angle)
@@ -287,16 +331,60 @@ def handle_process_all(data):
             
             print(f"Complete result: {json.dumps(result, indent=2)}")
             emit('result', result)
+            publish_preview(frames, angle, sound_description, detection_info)
             
         finally:
             os.unlink(temp_audio_path)
-            os.unlink(temp_front_path)
-            os.unlink(temp_back_path)
             
     except Exception as e:
         print(f"Error processing: {str(e)}")
         emit('error', {'message': str(e)})
 
+@app.route('/preview')
+def preview_feed():
+    """Live MJPEG of annotated detections, capped to PREVIEW_FPS.
+
+    Disabled unless PREVIEW_TOKEN is set; pass it as X-Preview-Token or ?token=
+    (an <img> tag can't send headers).
+    """
+    token = request.headers.get('X-Preview-Token') or request.args.get('token')
+    if not token_matches(token, app.config['PREVIEW_TOKEN']):
+        return jsonify({'error': 'Invalid preview token'}), 403
+    
+    return Response(preview.frames(), mimetype=f'multipart/x-mixed-replace; boundary={BOUNDARY}')
+
+@socketio.on('configure_profiling')
+def handle_configure_profiling(data=None):
+    """Arm or disarm the request profiler at runtime"""
+    data = data or {}
+    if not profiling_allowed(data.get('token')):
+        emit('error', {'message': 'Invalid profiling token'})
+        return
+    
+    try:
+        status = configure_profiling(data)
+    except (TypeError, ValueError) as e:
+        emit('error', {'message': str(e)})
+        return
+    print(f"Profiling configured: {status}")
+    emit('profiling_status', status)
+
+@app.route('/admin/profiling', methods=['GET', 'POST'])
+def admin_profiling():
+    """GET returns profiler status, POST takes {requests, slow_ms, memory, interval, enabled}"""
+    if not profiling_allowed(request.headers.get('X-Admin-Token')):
+        return jsonify({'error': 'Invalid profiling token'}), 403
+    
+    if request.method == 'POST':
+        try:
+            status = configure_profiling(request.get_json(silent=True) or {})
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        print(f"Profiling configured: {status}")
+        return jsonify(status)
+    
+    return jsonify(profiler.status())
+
 @app.route("/example")
 def example():
     return render_template("example.html")
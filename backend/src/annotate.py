@@ -0,0 +1,125 @@
+from functools import lru_cache
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+BOX_COLOR = (0, 255, 0)
+CENTER_COLOR = (0, 0, 255)
+TEXT_COLOR = (0, 255, 0)
+LABEL_BACKGROUND = (0, 0, 0)
+LABEL_PADDING = 10
+
+FONT_CANDIDATES = [
+    "arial.ttf",
+    "DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/Library/Fonts/Arial.ttf",
+]
+
+
+@lru_cache(maxsize=1)
+def _font_path() -> str:
+    # Resolve once so missing fonts don't raise on every frame
+    for candidate in FONT_CANDIDATES:
+        try:
+            ImageFont.truetype(candidate, 12)
+            return candidate
+        except OSError:
+            continue
+    return None
+
+
+@lru_cache(maxsize=16)
+def get_font(size: int):
+    path = _font_path()
+    if path is None:
+        return ImageFont.load_default()
+    return ImageFont.truetype(path, size)
+
+
+@lru_cache(maxsize=1)
+def _measure_draw() -> ImageDraw.ImageDraw:
+    return ImageDraw.Draw(Image.new("RGB", (1, 1)))
+
+
+def render_label(label: str, font_size: int) -> np.ndarray:
+    """Render a padded label into a small BGR patch"""
+    font = get_font(font_size)
+    left, top, right, bottom = _measure_draw().textbbox((0, 0), label, font=font)
+    width = right - left + 2 * LABEL_PADDING
+    height = bottom - top + 2 * LABEL_PADDING
+
+    patch = Image.new("RGB", (width, height), LABEL_BACKGROUND[::-1])
+    ImageDraw.Draw(patch).text((LABEL_PADDING - left, LABEL_PADDING - top), label, fill=TEXT_COLOR[::-1], font=font)
+
+    return np.asarray(patch)[:, :, ::-1]
+
+
+def _blit(frame: np.ndarray, patch: np.ndarray, x: int, y: int):
+    frame_height, frame_width = frame.shape[:2]
+    patch_height, patch_width = patch.shape[:2]
+
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(frame_width, x + patch_width), min(frame_height, y + patch_height)
+    if x0 >= x1 or y0 >= y1:
+        return
+    frame[y0:y1, x0:x1] = patch[y0 - y:y1 - y, x0 - x:x1 - x]
+
+
+def annotate_frame(frame: np.ndarray, bbox: list, angle: float, sound: str, detection_info: dict) -> np.ndarray:
+    """Draw the detection box, center and label onto a decoded BGR frame in place"""
+    height, width = frame.shape[:2]
+    x_min, y_min, x_max, y_max = bbox
+
+    x_min = int(max(0, min(x_min, width)))
+    y_min = int(max(0, min(y_min, height)))
+    x_max = int(max(0, min(x_max, width)))
+    y_max = int(max(0, min(y_max, height)))
+
+    if x_min >= x_max or y_min >= y_max:
+        return None
+
+    box_width = max(5, int(width / 300))
+    cv2.rectangle(frame, (x_min, y_min), (x_max, y_max), BOX_COLOR, box_width)
+
+    center = ((x_min + x_max) // 2, (y_min + y_max) // 2)
+    circle_radius = max(10, int(width / 200))
+    cv2.circle(frame, center, circle_radius, CENTER_COLOR, -1)
+
+    yolo_class = detection_info.get("yolo_class", "unknown")
+    yolo_conf = detection_info.get("yolo_confidence", 0)
+    label = f"{yolo_class} ({yolo_conf:.2f}) | {sound} | {angle:.1f}°"
+
+    patch = render_label(label, max(30, int(width / 40)))
+    text_height = patch.shape[0] - 2 * LABEL_PADDING
+    text_y = y_min - text_height - 15
+    if text_y < 0:
+        text_y = y_min + 15
+    _blit(frame, patch, x_min - LABEL_PADDING, text_y - LABEL_PADDING)
+
+    return frame
+
+
+class AdaptiveJpegEncoder:
+    """Encodes JPEGs in memory, nudging quality toward a target size per frame"""
+
+    def __init__(self, target_bytes: int = 60000, quality: int = 80, min_quality: int = 40, max_quality: int = 90, step: int = 5):
+        self.target_bytes = target_bytes
+        self.quality = quality
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self.step = step
+
+    def encode(self, frame: np.ndarray) -> bytes:
+        quality = self.quality
+        ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            raise ValueError("JPEG encoding failed")
+
+        size = len(buffer)
+        if size > self.target_bytes * 1.1:
+            self.quality = max(self.min_quality, quality - self.step)
+        elif size < self.target_bytes * 0.7:
+            self.quality = min(self.max_quality, quality + self.step)
+
+        return buffer.tobytes()
@@ -0,0 +1,267 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+AUDIO_EXTS = ('.wav', '.mp3', '.webm', '.ogg', '.m4a', '.flac')
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+CAMERA_NAMES = ('front', 'back')
+STAGES = ('decode', 'recognize', 'detect', 'total')
+
+# Shared across worker processes, caps concurrent calls to the recognition client
+_recognition_slots = None
+
+
+def _find_files(directory: str, exts: tuple, names: tuple = None, exclude: tuple = ()) -> list:
+    matches = []
+    for entry in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(entry)
+        stem = stem.lower()
+        if ext.lower() not in exts or stem in exclude:
+            continue
+        if names is None or stem in names:
+            matches.append(os.path.join(directory, entry))
+    return matches
+
+
+def scan_directory(root: str) -> list:
+    """Each sample is a subdirectory holding one audio file plus front.* and back.* images"""
+    samples = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        front = _find_files(dirpath, IMAGE_EXTS, names=('front',))
+        back = _find_files(dirpath, IMAGE_EXTS, names=('back',))
+        if not front or not back:
+            continue
+
+        sample_id = os.path.relpath(dirpath, root).replace(os.sep, '/')
+        audio = _find_files(dirpath, AUDIO_EXTS, exclude=CAMERA_NAMES)
+        if len(audio) != 1:
+            found = ', '.join(os.path.basename(path) for path in audio) or 'none'
+            print(f"⚠️  Skipping {sample_id}: expected one audio file, found {found}")
+            continue
+
+        samples.append({'id': sample_id, 'audio': audio[0], 'front': front[0], 'back': back[0]})
+    return samples
+
+
+def load_manifest(path: str) -> list:
+    """Read a .jsonl or .csv manifest with id, audio, front and back fields"""
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith('.csv'):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    samples = []
+    for i, row in enumerate(rows):
+        missing = [key for key in ('audio', 'front', 'back') if not row.get(key)]
+        if missing:
+            raise ValueError(f"Manifest row {i + 1} is missing {', '.join(missing)}")
+        sample = {'id': str(row.get('id') or row['audio'])}
+        for key in ('audio', 'front', 'back'):
+            sample[key] = os.path.join(base, row[key])
+        samples.append(sample)
+    return samples
+
+
+def load_completed(path: str, retry_failed: bool = False) -> set:
+    """Collect ids already written to the output file so an interrupted run can resume"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Partial line left behind by a crash mid-write
+                continue
+            if retry_failed and 'error' in record:
+                continue
+            done.add(record.get('id'))
+    return done
+
+
+def decode_audio(audio_path: str) -> tuple[str, str]:
+    """Return a wav/mp3 path for the recognition client, plus a temp file to clean up"""
+    if os.path.splitext(audio_path)[1].lower() in ('.wav', '.mp3'):
+        return audio_path, None
+
+    temp_wav = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
+    temp_wav.close()
+    try:
+        subprocess.run([
+            'ffmpeg', '-i', audio_path,
+            '-ar', '16000', '-ac', '1', '-y',
+            temp_wav.name
+        ], check=True, capture_output=True)
+    except BaseException:
+        os.unlink(temp_wav.name)
+        raise
+    return temp_wav.name, temp_wav.name
+
+
+def _init_worker(recognition_slots, torch_threads):
+    global _recognition_slots
+    _recognition_slots = recognition_slots
+
+    # Torch uses every core per process by default, which oversubscribes a pool of workers
+    import torch
+    torch.set_num_threads(torch_threads)
+
+
+def process_sample(sample: dict) -> dict:
+    # Imported here so the model and client load once per worker, not in the parent
+    from src.recognition import recognize_sound, infer_sound_direction, calculate_motor_powers, build_output
+
+    timings = {}
+    record = {'id': sample['id']}
+    start = time.perf_counter()
+    temp_path = None
+
+    try:
+        audio_path, temp_path = decode_audio(sample['audio'])
+        timings['decode'] = time.perf_counter() - start
+
+        stage_start = time.perf_counter()
+        if _recognition_slots is not None:
+            with _recognition_slots:
+                sound = recognize_sound(audio_path)
+        else:
+            sound = recognize_sound(audio_path)
+        timings['recognize'] = time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        angle, detection_info = infer_sound_direction(sample['front'], sample['back'], sound)
+        timings['detect'] = time.perf_counter() - stage_start
+
+        record.update(build_output(sound, angle, calculate_motor_powers(angle), detection_info))
+    except Exception as e:
+        record['error'] = f"{type(e).__name__}: {e}"
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+    timings['total'] = time.perf_counter() - start
+    record['timings'] = {stage: round(seconds, 4) for stage, seconds in timings.items()}
+    return record
+
+
+def _percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def print_summary(records: list, elapsed: float):
+    failed = sum(1 for record in records if 'error' in record)
+    print("\nBATCH SUMMARY")
+    print(f"Processed: {len(records)} samples ({failed} failed) in {elapsed:.1f}s")
+    if elapsed > 0:
+        print(f"Throughput: {len(records) / elapsed:.2f} samples/s\n")
+
+    print(f"{'stage':10} {'mean':>8} {'p50':>8} {'p95':>8} {'total':>10}")
+    for stage in STAGES:
+        values = [record['timings'][stage] for record in records if stage in record.get('timings', {})]
+        if not values:
+            continue
+        print(f"{stage:10} {sum(values) / len(values):>7.3f}s {_percentile(values, 50):>7.3f}s "
+              f"{_percentile(values, 95):>7.3f}s {sum(values):>9.1f}s")
+    print("="*50)
+
+
+def run_batch(samples: list, output_path: str, workers: int, max_recognition: int, retry_failed: bool = False, torch_threads: int = 1) -> list:
+    completed = load_completed(output_path, retry_failed)
+    pending = [sample for sample in samples if sample['id'] not in completed]
+    print(f"{len(samples)} samples found, {len(samples) - len(pending)} already done, {len(pending)} to process")
+    if not pending:
+        return []
+
+    # Start a new line if the previous run died halfway through writing a record
+    if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+        with open(output_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b'\n'
+    else:
+        needs_newline = False
+
+    # Spawn so every worker gets its own clean torch/OpenAI state
+    context = multiprocessing.get_context('spawn')
+    recognition_slots = context.BoundedSemaphore(max_recognition)
+
+    records = []
+    start = time.perf_counter()
+    with open(output_path, 'a', encoding='utf-8') as out, \
+         ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(recognition_slots, torch_threads)) as pool:
+        if needs_newline:
+            out.write('\n')
+
+        # Only keep about one sample per worker in flight, so a dead worker can
+        # be pinned on the few samples that were running rather than the whole queue
+        queue = iter(pending)
+        in_flight = {}
+        broken = False
+        while True:
+            while not broken and len(in_flight) < workers * 2:
+                sample = next(queue, None)
+                if sample is None:
+                    break
+                in_flight[pool.submit(process_sample, sample)] = sample
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                sample = in_flight.pop(future)
+                try:
+                    record = future.result()
+                except BrokenProcessPool:
+                    broken = True
+                    record = {'id': sample['id'], 'error': "BrokenProcessPool: worker process died"}
+                except Exception as e:
+                    record = {'id': sample['id'], 'error': f"{type(e).__name__}: {e}"}
+
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                out.flush()
+                records.append(record)
+
+                status = record.get('error') or f"{record['sound']} @ {record['angle']}°"
+                print(f"[{len(records)}/{len(pending)}] {record['id']}: {status}")
+
+        if broken:
+            print(f"\n⚠️  A worker process died, stopping early. Samples in flight were marked failed; "
+                  f"re-run to continue, or use --retry-failed to retry them.")
+
+    print_summary(records, time.perf_counter() - start)
+    return records
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Re-score recorded (audio, front, back) samples offline")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--dir', help="directory with one subdirectory per sample")
+    source.add_argument('--manifest', help=".jsonl or .csv with id, audio, front, back columns")
+    parser.add_argument('--output', default='results.jsonl', help="JSONL file to append results to")
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1), help="process pool size, each worker loads its own model")
+    parser.add_argument('--torch-threads', type=int, default=1, help="torch threads per worker")
+    parser.add_argument('--max-recognition', type=int, default=4, help="max concurrent recognition client calls")
+    parser.add_argument('--retry-failed', action='store_true', help="re-run samples that previously errored")
+    args = parser.parse_args(argv)
+
+    samples = scan_directory(args.dir) if args.dir else load_manifest(args.manifest)
+    run_batch(samples, args.output, max(1, args.workers), max(1, args.max_recognition), args.retry_failed,
+              max(1, args.torch_threads))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
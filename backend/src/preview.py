@@ -0,0 +1,75 @@
+import threading
+import time
+from functools import lru_cache
+import numpy as np
+from src.annotate import AdaptiveJpegEncoder
+
+BOUNDARY = 'frame'
+
+
+@lru_cache(maxsize=1)
+def _placeholder_jpeg() -> bytes:
+    # Sent as a keep-alive before anything has been published
+    return AdaptiveJpegEncoder().encode(np.zeros((240, 320, 3), dtype=np.uint8))
+
+
+def _part(jpeg: bytes) -> bytes:
+    return (f'--{BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n').encode() + jpeg + b'\r\n'
+
+
+class PreviewStream:
+    """Latest annotated frame shared with MJPEG viewers.
+
+    Frames are encoded once on publish, at most `fps` times per second and
+    only while someone is watching, so viewers never add work to inference.
+    """
+
+    def __init__(self, fps: float = 5.0, encoder: AdaptiveJpegEncoder = None):
+        self.fps = fps
+        self.encoder = encoder or AdaptiveJpegEncoder()
+        self._condition = threading.Condition()
+        self._jpeg = None
+        self._frame_id = 0
+        self._last_publish = 0.0
+        self._viewers = 0
+
+    @property
+    def viewers(self) -> int:
+        return self._viewers
+
+    def wants_frame(self) -> bool:
+        if self._viewers == 0 or self.fps <= 0:
+            return False
+        return time.monotonic() - self._last_publish >= 1.0 / self.fps
+
+    def publish(self, frame) -> bool:
+        if frame is None or not self.wants_frame():
+            return False
+
+        self._last_publish = time.monotonic()
+        jpeg = self.encoder.encode(frame)
+        with self._condition:
+            self._jpeg = jpeg
+            self._frame_id += 1
+            self._condition.notify_all()
+        return True
+
+    def frames(self, timeout: float = 5.0):
+        """Yield multipart MJPEG parts as new frames are published.
+
+        When nothing new arrives within `timeout` the last frame is re-sent, so a
+        disconnected viewer fails on write and stops counting as a viewer.
+        """
+        with self._condition:
+            self._viewers += 1
+        try:
+            last_id = 0
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: self._frame_id != last_id, timeout=timeout)
+                    jpeg, last_id = self._jpeg, self._frame_id
+
+                yield _part(jpeg if jpeg is not None else _placeholder_jpeg())
+        finally:
+            with self._condition:
+                self._viewers -= 1
@@ -0,0 +1,239 @@
+import functools
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, deque
+
+DEFAULT_INTERVAL = 0.005
+TOP_ALLOCATIONS = 25
+MAX_DUMPS = 100
+PROFILE_EXTS = ('.collapsed', '.tracemalloc', '.alloc.txt')
+
+
+def _safe_tag(value) -> str:
+    # No dots, so everything before the first '.' identifies one request's files
+    return re.sub(r'[^A-Za-z0-9_-]', '_', str(value))[:64] or 'unknown'
+
+
+class _StackSampler(threading.Thread):
+    """Periodically records the call stack of one thread as collapsed stack strings"""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._labels = {}
+        self._stop_event = threading.Event()
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            filename = os.path.basename(code.co_filename)
+            label = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(';', ':')
+            self._labels[code] = label
+        return label
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class RequestProfiler:
+    """Opt-in per-request profiler, armed at runtime.
+
+    Samples the handling thread's stack and, optionally, tracemalloc
+    allocations. Output is written as collapsed stacks (loadable in
+    speedscope or flamegraph.pl) plus allocation snapshots, one set of
+    files per request tagged with request ID and device.
+    """
+
+    def __init__(self, output_dir: str = 'profiles', interval: float = DEFAULT_INTERVAL, max_kept: int = MAX_DUMPS):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.max_kept = max_kept
+        self._lock = threading.Lock()
+        self._remaining = 0
+        self._slow_ms = None
+        self._memory = False
+        self._memory_session = False
+        self._started_tracemalloc = False
+        self._written = deque(maxlen=100)
+
+    def configure(self, requests: int = 0, slow_ms: float = None, memory: bool = False, interval: float = None) -> dict:
+        """Arm profiling for the next `requests` requests.
+
+        With `slow_ms`, every request is sampled but only those slower than the
+        threshold are written, and `requests` caps the number of dumps
+        (0 means up to MAX_DUMPS). Memory tracing is too costly to run on
+        every request, so it is only allowed in fixed-count mode. tracemalloc
+        is process-wide, so only one request is memory-traced at a time and
+        overlapping requests get stack samples only.
+        """
+        requests = int(requests)
+        slow_ms = float(slow_ms) if slow_ms is not None else None
+        if requests < 0:
+            raise ValueError("requests must be zero or positive")
+        if slow_ms is not None and memory:
+            raise ValueError("memory profiling cannot be combined with slow_ms")
+        if slow_ms is not None and requests == 0:
+            requests = MAX_DUMPS
+
+        with self._lock:
+            self._remaining = min(requests, MAX_DUMPS)
+            self._slow_ms = slow_ms
+            self._memory = bool(memory)
+            if interval is not None:
+                self.interval = max(0.001, float(interval))
+        return self.status()
+
+    def disable(self) -> dict:
+        return self.configure(requests=0)
+
+    @property
+    def armed(self) -> bool:
+        return self._remaining > 0 or self._slow_ms is not None
+
+    def status(self) -> dict:
+        return {
+            'armed': self.armed,
+            'remaining': self._remaining,
+            'slow_ms': self._slow_ms,
+            'memory': self._memory,
+            'interval': self.interval,
+            'output_dir': os.path.abspath(self.output_dir),
+            'recent': list(self._written)[-10:]
+        }
+
+    def _claim(self) -> tuple[bool, bool]:
+        """Return (profile, trace memory) for a new request.
+
+        Fixed-count mode hands out slots up front, slow mode decides after the
+        request and never traces memory.
+        """
+        with self._lock:
+            if self._slow_ms is not None:
+                return True, False
+            if self._remaining == 0:
+                return False, False
+
+            self._remaining -= 1
+            if not self._memory or self._memory_session:
+                return True, False
+            self._memory_session = True
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(16)
+                self._started_tracemalloc = True
+            return True, True
+
+    def _should_write(self, duration_ms: float) -> bool:
+        with self._lock:
+            if self._slow_ms is None:
+                return True
+            if duration_ms < self._slow_ms:
+                return False
+            if self._remaining > 0:
+                self._remaining -= 1
+                if self._remaining == 0:
+                    self._slow_ms = None
+            return True
+
+    def _stop_memory(self):
+        with self._lock:
+            self._memory_session = False
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+
+    def profiled(self, name: str, device=None):
+        """Decorator for handlers; `device` is a callable returning the device tag"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.armed:
+                    return func(*args, **kwargs)
+                claimed, memory = self._claim()
+                if not claimed:
+                    return func(*args, **kwargs)
+
+                request_id = uuid.uuid4().hex[:12]
+                device_tag = device() if callable(device) else device
+                before = tracemalloc.take_snapshot() if memory else None
+
+                sampler = _StackSampler(threading.get_ident(), self.interval)
+                sampler.start()
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    duration_ms = (time.perf_counter() - start) * 1000
+                    sampler.stop()
+                    after = tracemalloc.take_snapshot() if memory else None
+                    if memory:
+                        self._stop_memory()
+                    if self._should_write(duration_ms):
+                        self._write(name, request_id, device_tag, duration_ms, sampler, before, after)
+            return wrapper
+        return decorator
+
+    def _write(self, name, request_id, device, duration_ms, sampler, before, after):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            base = os.path.join(self.output_dir, f"{int(time.time())}_{_safe_tag(name)}_{request_id}_{_safe_tag(device)}")
+
+            with open(f"{base}.collapsed", 'w', encoding='utf-8') as f:
+                for stack, count in sampler.counts.most_common():
+                    f.write(f"{stack} {count}\n")
+            files = [f"{base}.collapsed"]
+
+            if after is not None:
+                after.dump(f"{base}.tracemalloc")
+                with open(f"{base}.alloc.txt", 'w', encoding='utf-8') as f:
+                    f.write(f"# {name} request={request_id} device={device} duration={duration_ms:.1f}ms\n")
+                    f.write("# tracemalloc is process-wide: other requests running at the same time are included\n")
+                    for stat in after.compare_to(before, 'lineno')[:TOP_ALLOCATIONS]:
+                        f.write(f"{stat}\n")
+                files += [f"{base}.tracemalloc", f"{base}.alloc.txt"]
+
+            entry = {
+                'request_id': request_id,
+                'device': device,
+                'handler': name,
+                'duration_ms': round(duration_ms, 1),
+                'samples': sum(sampler.counts.values()),
+                'files': files
+            }
+            with self._lock:
+                self._written.append(entry)
+            self._prune()
+            print(f"Profile for {name} ({request_id}, {duration_ms:.0f}ms) saved to {base}.*")
+        except OSError as e:
+            print(f"Error writing profile: {str(e)}")
+
+    def _prune(self):
+        """Keep only the newest `max_kept` requests' files in output_dir"""
+        groups = {}
+        for entry in os.listdir(self.output_dir):
+            if not entry.endswith(PROFILE_EXTS):
+                continue
+            path = os.path.join(self.output_dir, entry)
+            groups.setdefault(entry.split('.', 1)[0], []).append(path)
+
+        oldest_first = sorted(groups.values(), key=lambda paths: max(os.path.getmtime(path) for path in paths))
+        for paths in oldest_first[:max(0, len(groups) - self.max_kept)]:
+            for path in paths:
+                os.unlink(path)
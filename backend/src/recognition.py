@@ -3,7 +3,6 @@ import base64
 import json
 from dotenv import load_dotenv
 from openai import OpenAI
-from PIL import Image, ImageDraw, ImageFont
 from ultralytics import YOLO
 import cv2
 import numpy as np
@@ -94,8 +93,13 @@ def match_sound_to_yolo_class(sound_description: str, yolo_classes: list) -> lis
     return matches
 
 
-def detect_objects_yolo(image_path: str, sound_description: str, camera_name: str = "front") -> dict:
-    img = cv2.imread(image_path)
+def decode_image(image_bytes: bytes) -> np.ndarray:
+    return cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def detect_objects_yolo(image, sound_description: str, camera_name: str = "front") -> dict:
+    # Accepts a file path or an already decoded BGR frame
+    img = cv2.imread(image) if isinstance(image, str) else image
     if img is None:
         return {
             "camera": "none",
@@ -107,7 +111,7 @@ def detect_objects_yolo(image_path: str, sound_description: str, camera_name: st
     
     height, width = img.shape[:2]
 
-    results = yolo_model(image_path, verbose=False)
+    results = yolo_model(img, verbose=False)
 
     yolo_classes = results[0].names
     
@@ -172,13 +176,13 @@ def detect_objects_yolo(image_path: str, sound_description: str, camera_name: st
     }
 
 
-def infer_sound_direction(front_image_path: str, back_image_path: str, sound_description: str) -> tuple[float, dict]:
+def infer_sound_direction(front_image, back_image, sound_description: str) -> tuple[float, dict]:
 
     print("\nRunning YOLOv8 on front camera...")
-    front_detection = detect_objects_yolo(front_image_path, sound_description, "front")
+    front_detection = detect_objects_yolo(front_image, sound_description, "front")
     
     print("Running YOLOv8 on back camera...")
-    back_detection = detect_objects_yolo(back_image_path, sound_description, "back")
+    back_detection = detect_objects_yolo(back_image, sound_description, "back")
 
     if front_detection["camera"] == "none" and back_detection["camera"] == "none":
         print("No objects detected in either camera")
@@ -208,74 +212,42 @@ def infer_sound_direction(front_image_path: str, back_image_path: str, sound_des
 
 
 def draw_bounding_box(image_path: str, bbox: list, angle: float, sound: str, detection_info: dict, output_path: str = None):
+    try:
+        from src.annotate import annotate_frame
+    except ImportError:
+        # Run as backend/src/recognition.py from the repo root
+        from annotate import annotate_frame
 
-    img = Image.open(image_path)
-    draw = ImageDraw.Draw(img)
+    img = cv2.imread(image_path)
+    if img is None:
+        print("⚠️  Warning: Could not read image to annotate!")
+        return None
     
-    print(f"\nImage size: {img.width}x{img.height}")
+    print(f"\nImage size: {img.shape[1]}x{img.shape[0]}")
     print(f"Bounding box: {bbox}")
     
-    x_min, y_min, x_max, y_max = bbox
-    
-
-    x_min = max(0, min(x_min, img.width))
-    y_min = max(0, min(y_min, img.height))
-    x_max = max(0, min(x_max, img.width))
-    y_max = max(0, min(y_max, img.height))
-    
-    if x_min >= x_max or y_min >= y_max:
+    if annotate_frame(img, bbox, angle, sound, detection_info) is None:
         print("⚠️  Warning: Invalid bounding box coordinates!")
         return None
-
-    box_color = (0, 255, 0)
-    box_width = max(5, int(img.width / 300))
-    draw.rectangle([x_min, y_min, x_max, y_max], outline=box_color, width=box_width)
-
-    center_x = (x_min + x_max) / 2
-    center_y = (y_min + y_max) / 2
-    circle_radius = max(10, int(img.width / 200))
-    draw.ellipse(
-        [center_x - circle_radius, center_y - circle_radius, 
-         center_x + circle_radius, center_y + circle_radius],
-        fill=(255, 0, 0)
-    )
-    
-
-    yolo_class = detection_info.get("yolo_class", "unknown")
-    yolo_conf = detection_info.get("yolo_confidence", 0)
-    label = f"{yolo_class} ({yolo_conf:.2f}) | {sound} | {angle:.1f}°"
-    
-
-    try:
-        font_size = max(30, int(img.width / 40))
-        font = ImageFont.truetype("arial.ttf", font_size)
-    except:
-        font = ImageFont.load_default()
-    
-
-    text_bbox = draw.textbbox((0, 0), label, font=font)
-    text_width = text_bbox[2] - text_bbox[0]
-    text_height = text_bbox[3] - text_bbox[1]
-    
-    text_x = x_min
-    text_y = y_min - text_height - 15
-    if text_y < 0:
-        text_y = y_min + 15
-    
-
-    padding = 10
-    draw.rectangle(
-        [text_x - padding, text_y - padding, 
-         text_x + text_width + padding, text_y + text_height + padding],
-        fill=(0, 0, 0)
-    )
-    draw.text((text_x, text_y), label, fill=(0, 255, 0), font=font)
     
     if output_path is None:
         base, ext = os.path.splitext(image_path)
         output_path = f"{base}_annotated{ext}"
     
-    img.save(output_path, quality=95)
+    out_ext = os.path.splitext(output_path)[1].lower()
+    if out_ext in ('.jpg', '.jpeg'):
+        params = [cv2.IMWRITE_JPEG_QUALITY, 95]
+    elif out_ext == '.webp':
+        params = [cv2.IMWRITE_WEBP_QUALITY, 95]
+    else:
+        params = []
+    try:
+        saved = cv2.imwrite(output_path, img, params)
+    except cv2.error:
+        saved = False
+    if not saved:
+        print(f"⚠️  Warning: Could not save annotated image to {output_path}")
+        return None
     print(f"Annotated image saved to: {output_path}")
     
     return output_path
@@ -326,8 +298,8 @@ def visualize_motor_powers(motor_powers: dict, angle: float):
     print("="*50)
 
 
-def write_json(sound: str, angle: float, motor_powers: dict, detection_info: dict, annotated_image_path: str = None, path: str = "output.json"):
-    output_json = {
+def build_output(sound: str, angle: float, motor_powers: dict, detection_info: dict) -> dict:
+    return {
         "sound": sound, 
         "angle": round(angle, 2),
         "detection": {
@@ -342,7 +314,11 @@ def write_json(sound: str, angle: float, motor_powers: dict, detection_info: dic
             "motor_300": motor_powers.get("motor_300")
         }
     }
-    
+
+
+def write_json(sound: str, angle: float, motor_powers: dict, detection_info: dict, annotated_image_path: str = None, path: str = "output.json"):
+    output_json = build_output(sound, angle, motor_powers, detection_info)
+
     if annotated_image_path:
         output_json["annotated_image"] = annotated_image_path
 